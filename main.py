@@ -1,69 +1,245 @@
-from fastapi import FastAPI, HTTPException, Depends, Query
+from contextlib import asynccontextmanager, suppress
+import asyncio
+import logging
+from fastapi import FastAPI, HTTPException, Query
+from fastapi.responses import ORJSONResponse
 from pydantic import BaseModel
 from typing import List, Optional
-from sqlalchemy import create_engine, Column, Integer, String, ForeignKey
-from sqlalchemy.orm import sessionmaker, declarative_base, relationship, Session
-from dotenv import load_dotenv
+from sqlalchemy import String, select, update, bindparam, text
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.dialects.postgresql import array, insert as pg_insert
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import joinedload
+import redis.asyncio as aioredis
+from redis.exceptions import RedisError
+import orjson
 import os
+from models import USE_PGBOUNCER, engine, SessionLocal, usage_engine, UsageSessionLocal, User, SubscriptionPlan, UserSubscription, Permission
 
-# Load environment variables
-load_dotenv()
+logger = logging.getLogger(__name__)
 
-# Get the DATABASE_URL
-DATABASE_URL = os.getenv("DATABASE_URL")
-if not DATABASE_URL:
-    raise ValueError("DATABASE_URL is not set. Please check your environment variables.")
-
-# Database setup
-engine = create_engine(DATABASE_URL)
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
-Base = declarative_base()
+# Start and stop the background usage flusher with the application
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    stop_flusher = asyncio.Event()
+    flusher = asyncio.create_task(flush_usage_loop(stop_flusher)) if redis is not None else None
+    yield
+    try:
+        if flusher is not None:
+            # Signal instead of cancelling so a flush in progress always runs to completion
+            stop_flusher.set()
+            await flusher
+            await flush_usage()
+    except Exception:
+        # Unflushed deltas stay in the Redis pending hash for the next instance to pick up
+        logger.exception("Failed to flush usage counters")
+    finally:
+        if redis is not None:
+            await redis.aclose()
+        await engine.dispose()
+        if usage_engine is not engine:
+            await usage_engine.dispose()
 
 # FastAPI Application
-app = FastAPI()
+app = FastAPI(lifespan=lifespan, default_response_class=ORJSONResponse)
+
+# api_permissions @> ARRAY[:api] is the containment form the GIN index can serve (= ANY can't)
+API_ALLOWED = SubscriptionPlan.api_permissions.contains(array([bindparam("api", type_=String)]))
+
+# Hot-path statements are built once so SQLAlchemy reuses the compiled SQL and
+# asyncpg reuses its prepared statements; values are passed as bind parameters
+GET_SUBSCRIPTION_WITH_PLAN = (
+    select(UserSubscription)
+    .options(joinedload(UserSubscription.plan))
+    .where(UserSubscription.user_id == bindparam("uid"))
+)
+GET_PLAN_ID_BY_USER = select(UserSubscription.plan_id).where(UserSubscription.user_id == bindparam("uid"))
+GET_USAGE_COUNT_BY_USER = select(UserSubscription.usage_count).where(UserSubscription.user_id == bindparam("uid"))
+GET_SUBSCRIPTION_BY_USER = select(UserSubscription).where(UserSubscription.user_id == bindparam("uid"))
+CONSUME_ACCESS = (
+    update(UserSubscription)
+    .where(
+        UserSubscription.user_id == bindparam("uid"),
+        UserSubscription.plan_id == SubscriptionPlan.id,
+        API_ALLOWED,
+        UserSubscription.usage_count < SubscriptionPlan.usage_limit,
+    )
+    .values(usage_count=UserSubscription.usage_count + 1)
+    .returning(UserSubscription.id)
+    .execution_options(synchronize_session=False)
+)
+GET_ACCESS_DENIAL = (
+    select(API_ALLOWED)
+    .join(UserSubscription, UserSubscription.plan_id == SubscriptionPlan.id)
+    .where(UserSubscription.user_id == bindparam("uid"))
+)
+# Bulk inserts take a list of parameter sets; SQLAlchemy sends them as batched
+# multi-row INSERTs, so the statement text stays fixed no matter how many rows come in
+BULK_INSERT_PLANS = pg_insert(SubscriptionPlan).on_conflict_do_nothing(index_elements=["name"]).returning(SubscriptionPlan.id)
+BULK_INSERT_PERMISSIONS = pg_insert(Permission).on_conflict_do_nothing().returning(Permission.id)
+BULK_INSERT_SUBSCRIPTIONS = pg_insert(UserSubscription).on_conflict_do_nothing(index_elements=["user_id"]).returning(UserSubscription.id)
+# PgBouncer can't carry the usage engine's synchronous_commit=off connection setting,
+# so there the usage transactions switch it off themselves (lasts for the transaction only)
+ASYNC_COMMIT = text("SET LOCAL synchronous_commit = off")
+FLUSH_USAGE = (
+    update(UserSubscription.__table__)
+    .where(UserSubscription.__table__.c.user_id == bindparam("uid"))
+    .values(usage_count=UserSubscription.__table__.c.usage_count + bindparam("delta"))
+)
+
+# Cache setup (optional): plans and user -> plan lookups are read-through cached in Redis
+REDIS_URL = os.getenv("REDIS_URL")
+CACHE_TTL = int(os.getenv("CACHE_TTL", "60"))
+redis = aioredis.from_url(REDIS_URL, decode_responses=True) if REDIS_URL else None
+
+# Always stored in plan:{id}:perms so a plan with no permissions still has a cached set;
+# "" can never match because api_request is a non-empty path segment
+PERMS_SENTINEL = ""
 
-# Dependency to get the database session
-def get_db():
-    db = SessionLocal()
+def plan_to_dict(plan: SubscriptionPlan) -> dict:
+    return {
+        "name": plan.name,
+        "description": plan.description,
+        "api_permissions": plan.api_permissions,
+        "usage_limit": plan.usage_limit,
+    }
+
+# The cache helpers never let a Redis outage fail a request: errors are logged and
+# treated as a miss (reads) or skipped (writes and invalidations, which expire with CACHE_TTL)
+async def cache_get(key: str) -> Optional[str]:
+    if redis is None:
+        return None
     try:
-        yield db
-    finally:
-        db.close()
-
-# Database Models
-class User(Base):
-    __tablename__ = "users"
-    id = Column(Integer, primary_key=True, index=True)
-    name = Column(String(255), nullable=False)
-    email = Column(String(255), unique=True, nullable=False)
-    subscriptions = relationship("UserSubscription", back_populates="user")
-
-class SubscriptionPlan(Base):
-    __tablename__ = "subscription_plans"
-    id = Column(Integer, primary_key=True, index=True)
-    name = Column(String(255), unique=True, nullable=False)
-    description = Column(String(255), nullable=True)
-    api_permissions = Column(String(1024), nullable=False)
-    usage_limit = Column(Integer, nullable=False)
-    subscriptions = relationship("UserSubscription", back_populates="plan")
-
-class UserSubscription(Base):
-    __tablename__ = "user_subscriptions"
-    id = Column(Integer, primary_key=True, index=True)
-    user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
-    plan_id = Column(Integer, ForeignKey("subscription_plans.id"), nullable=False)
-    usage_count = Column(Integer, default=0, nullable=False)
-    plan = relationship("SubscriptionPlan", back_populates="subscriptions")
-    user = relationship("User", back_populates="subscriptions")
-
-class Permission(Base):
-    __tablename__ = "permissions"
-    id = Column(Integer, primary_key=True, index=True)
-    name = Column(String(255), unique=True, nullable=False)
-    description = Column(String(255), nullable=True)
-    api_endpoint = Column(String(255), unique=True, nullable=False)
-
-Base.metadata.create_all(bind=engine)
+        return await redis.get(key)
+    except RedisError as exc:
+        logger.warning("Redis GET %s failed: %s", key, exc)
+        return None
+
+async def cache_set(key: str, value):
+    if redis is None:
+        return
+    try:
+        await redis.set(key, value, ex=CACHE_TTL)
+    except RedisError as exc:
+        logger.warning("Redis SET %s failed: %s", key, exc)
+
+async def cache_delete(*keys: str):
+    if redis is None or not keys:
+        return
+    try:
+        await redis.delete(*keys)
+    except RedisError as exc:
+        logger.warning("Redis DEL %s failed: %s", " ".join(keys), exc)
+
+async def cache_plan(plan: SubscriptionPlan) -> dict:
+    data = plan_to_dict(plan)
+    if redis is not None:
+        perms_key = f"plan:{plan.id}:perms"
+        pipe = redis.pipeline()
+        pipe.set(f"plan:{plan.id}", orjson.dumps(data), ex=CACHE_TTL)
+        pipe.delete(perms_key)
+        pipe.sadd(perms_key, PERMS_SENTINEL, *plan.api_permissions)
+        pipe.expire(perms_key, CACHE_TTL)
+        try:
+            await pipe.execute()
+        except RedisError as exc:
+            logger.warning("Redis caching of plan %s failed: %s", plan.id, exc)
+    return data
+
+async def get_plan(db: AsyncSession, plan_id: int) -> Optional[dict]:
+    cached = await cache_get(f"plan:{plan_id}")
+    if cached is not None:
+        return orjson.loads(cached)
+    plan = await db.get(SubscriptionPlan, plan_id)
+    if not plan:
+        return None
+    return await cache_plan(plan)
+
+async def get_subscription_plan_id(db: AsyncSession, user_id: int) -> Optional[int]:
+    cached = await cache_get(f"sub:{user_id}")
+    if cached is not None:
+        return int(cached)
+    plan_id = (await db.execute(GET_PLAN_ID_BY_USER, {"uid": user_id})).scalar_one_or_none()
+    if plan_id is not None:
+        await cache_set(f"sub:{user_id}", plan_id)
+    return plan_id
+
+async def plan_allows(db: AsyncSession, plan_id: int, api_request: str) -> bool:
+    # O(1) SISMEMBER on the cached permission set; falls back to the DB on a miss
+    if redis is not None:
+        perms_key = f"plan:{plan_id}:perms"
+        try:
+            allowed, cached = await redis.pipeline().sismember(perms_key, api_request).exists(perms_key).execute()
+        except RedisError as exc:
+            logger.warning("Redis permission lookup for plan %s failed: %s", plan_id, exc)
+            cached = False
+        if cached:
+            return bool(allowed)
+    plan = await get_plan(db, plan_id)
+    return plan is not None and api_request in plan["api_permissions"]
+
+# Usage counters: with Redis enabled, /access increments usage:{user_id} in Redis and
+# records the delta in a pending hash that a background task flushes to the DB
+USAGE_FLUSH_INTERVAL = float(os.getenv("USAGE_FLUSH_INTERVAL", "2"))
+PENDING_USAGE_KEY = "usage:pending"
+
+# Returns the new count, -1 if the limit is reached, or -2 if the counter is not seeded yet
+INCR_USAGE_SCRIPT = """
+if redis.call('EXISTS', KEYS[1]) == 0 then return -2 end
+local count = redis.call('INCR', KEYS[1])
+if count > tonumber(ARGV[1]) then
+    redis.call('DECR', KEYS[1])
+    return -1
+end
+redis.call('HINCRBY', KEYS[2], ARGV[2], 1)
+return count
+"""
+incr_usage_script = redis.register_script(INCR_USAGE_SCRIPT) if redis is not None else None
+
+async def get_usage_count(user_id: int) -> Optional[int]:
+    cached = await cache_get(f"usage:{user_id}")
+    return int(cached) if cached is not None else None
+
+async def incr_usage(db: AsyncSession, user_id: int, usage_limit: int) -> Optional[int]:
+    keys = [f"usage:{user_id}", PENDING_USAGE_KEY]
+    count = await incr_usage_script(keys=keys, args=[usage_limit, user_id])
+    if count == -2:
+        # Seed the counter from the DB the first time this user is seen
+        usage_count = (await db.execute(GET_USAGE_COUNT_BY_USER, {"uid": user_id})).scalar_one_or_none()
+        await redis.set(keys[0], usage_count or 0, nx=True)
+        count = await incr_usage_script(keys=keys, args=[usage_limit, user_id])
+    return count if count >= 0 else None
+
+async def flush_usage():
+    pipe = redis.pipeline(transaction=True)
+    pipe.hgetall(PENDING_USAGE_KEY)
+    pipe.delete(PENDING_USAGE_KEY)
+    pending, _ = await pipe.execute()
+    if not pending:
+        return
+    try:
+        async with UsageSessionLocal() as db, db.begin():
+            if USE_PGBOUNCER:
+                await db.execute(ASYNC_COMMIT)
+            await db.execute(FLUSH_USAGE, [{"uid": int(uid), "delta": int(delta)} for uid, delta in pending.items()])
+    except Exception:
+        # Put the deltas back so the next flush retries them
+        pipe = redis.pipeline()
+        for uid, delta in pending.items():
+            pipe.hincrby(PENDING_USAGE_KEY, uid, int(delta))
+        await pipe.execute()
+        raise
+
+async def flush_usage_loop(stop: asyncio.Event):
+    while not stop.is_set():
+        with suppress(asyncio.TimeoutError):
+            await asyncio.wait_for(stop.wait(), USAGE_FLUSH_INTERVAL)
+        if stop.is_set():
+            break
+        try:
+            await flush_usage()
+        except Exception:
+            logger.exception("Failed to flush usage counters")
 
 # Pydantic Models
 class UserCreate(BaseModel):
@@ -86,159 +262,245 @@ class SubscriptionAssign(BaseModel):
     user_id: int
     plan_id: int
 
+class PermissionCreate(BaseModel):
+    name: str
+    api_endpoint: str
+    description: Optional[str] = None
+
 # Routes for User Management
+# Each route opens its own session and transaction; leaving the block commits,
+# an exception (including HTTPException) rolls back and the session is closed either way
 @app.post("/users")
-def create_user(user: UserCreate, db: Session = Depends(get_db)):
-    existing_user = db.query(User).filter(User.email == user.email).first()
-    if existing_user:
-        raise HTTPException(status_code=400, detail="Email already registered")
-    new_user = User(name=user.name, email=user.email)
-    db.add(new_user)
-    db.commit()
-    db.refresh(new_user)
-    return {"message": "User created successfully", "user_id": new_user.id}
+async def create_user(user: UserCreate):
+    async with SessionLocal() as db, db.begin():
+        # The unique email constraint does the duplicate check; a skipped row returns no id
+        user_id = (await db.execute(
+            pg_insert(User).values(name=user.name, email=user.email)
+            .on_conflict_do_nothing(index_elements=["email"]).returning(User.id)
+        )).scalar_one_or_none()
+        if user_id is None:
+            raise HTTPException(status_code=400, detail="Email already registered")
+    return {"message": "User created successfully", "user_id": user_id}
 
 @app.get("/users", response_model=List[dict])
-def get_users(db: Session = Depends(get_db)):
-    users = db.query(User).all()
+async def get_users():
+    async with SessionLocal() as db, db.begin():
+        users = (await db.execute(select(User))).scalars().all()
     return [{"id": user.id, "name": user.name, "email": user.email} for user in users]
 
 # Routes for Subscription Plan Management
 @app.post("/plans")
-def create_plan(plan: PlanCreate, db: Session = Depends(get_db)):
-    existing_plan = db.query(SubscriptionPlan).filter(SubscriptionPlan.name == plan.name).first()
-    if existing_plan:
-        raise HTTPException(status_code=400, detail="Plan with this name already exists")
-    new_plan = SubscriptionPlan(
-        name=plan.name, description=plan.description,
-        api_permissions=",".join(plan.api_permissions),
-        usage_limit=plan.usage_limit
-    )
-    db.add(new_plan)
-    db.commit()
-    db.refresh(new_plan)
-    return {"message": "Plan created successfully", "plan_id": new_plan.id}
+async def create_plan(plan: PlanCreate):
+    async with SessionLocal() as db, db.begin():
+        plan_id = (await db.execute(
+            pg_insert(SubscriptionPlan).values(
+                name=plan.name, description=plan.description,
+                api_permissions=plan.api_permissions,
+                usage_limit=plan.usage_limit
+            ).on_conflict_do_nothing(index_elements=["name"]).returning(SubscriptionPlan.id)
+        )).scalar_one_or_none()
+        if plan_id is None:
+            raise HTTPException(status_code=400, detail="Plan with this name already exists")
+    return {"message": "Plan created successfully", "plan_id": plan_id}
+
+@app.post("/plans/bulk")
+async def create_plans_bulk(plans: List[PlanCreate]):
+    if not plans:
+        return {"message": "No plans created", "plan_ids": []}
+    async with SessionLocal() as db, db.begin():
+        # Plans whose name already exists are skipped
+        plan_ids = (await db.execute(BULK_INSERT_PLANS, [
+            {"name": plan.name, "description": plan.description,
+             "api_permissions": plan.api_permissions, "usage_limit": plan.usage_limit}
+            for plan in plans
+        ])).scalars().all()
+    return {"message": f"{len(plan_ids)} plans created successfully", "plan_ids": plan_ids}
 
 @app.put("/plans/{plan_id}")
-def update_plan(plan_id: int, plan: PlanUpdate, db: Session = Depends(get_db)):
-    existing_plan = db.query(SubscriptionPlan).filter(SubscriptionPlan.id == plan_id).first()
-    if not existing_plan:
-        raise HTTPException(status_code=404, detail="Plan not found")
-    if plan.name:
-        existing_plan.name = plan.name
-    if plan.description:
-        existing_plan.description = plan.description
-    if plan.api_permissions:
-        existing_plan.api_permissions = ",".join(plan.api_permissions)
-    if plan.usage_limit:
-        existing_plan.usage_limit = plan.usage_limit
-    db.commit()
+async def update_plan(plan_id: int, plan: PlanUpdate):
+    async with SessionLocal() as db, db.begin():
+        existing_plan = (await db.execute(select(SubscriptionPlan).where(SubscriptionPlan.id == plan_id))).scalar_one_or_none()
+        if not existing_plan:
+            raise HTTPException(status_code=404, detail="Plan not found")
+        if plan.name:
+            existing_plan.name = plan.name
+        if plan.description:
+            existing_plan.description = plan.description
+        if plan.api_permissions:
+            existing_plan.api_permissions = plan.api_permissions
+        if plan.usage_limit:
+            existing_plan.usage_limit = plan.usage_limit
+    await cache_delete(f"plan:{plan_id}", f"plan:{plan_id}:perms")
     return {"message": "Plan updated successfully"}
 
 @app.delete("/plans/{plan_id}")
-def delete_plan(plan_id: int, db: Session = Depends(get_db)):
-    plan = db.query(SubscriptionPlan).filter(SubscriptionPlan.id == plan_id).first()
-    if not plan:
-        raise HTTPException(status_code=404, detail="Plan not found")
-    db.delete(plan)
-    db.commit()
+async def delete_plan(plan_id: int):
+    async with SessionLocal() as db, db.begin():
+        plan = (await db.execute(select(SubscriptionPlan).where(SubscriptionPlan.id == plan_id))).scalar_one_or_none()
+        if not plan:
+            raise HTTPException(status_code=404, detail="Plan not found")
+        await db.delete(plan)
+    await cache_delete(f"plan:{plan_id}", f"plan:{plan_id}:perms")
     return {"message": "Plan deleted successfully"}
 
 # Routes for Permissions Management
 @app.post("/permissions")
-def add_permission(
+async def add_permission(
     name: str = Query(..., description="Permission name"), 
     api_endpoint: str = Query(..., description="API endpoint"), 
-    description: Optional[str] = Query(None, description="Permission description"), 
-    db: Session = Depends(get_db)
+    description: Optional[str] = Query(None, description="Permission description")
 ):
-    existing_permission = db.query(Permission).filter(Permission.name == name).first()
-    if existing_permission:
-        raise HTTPException(status_code=400, detail="Permission already exists")
-    new_permission = Permission(name=name, description=description, api_endpoint=api_endpoint)
-    db.add(new_permission)
-    db.commit()
-    db.refresh(new_permission)
-    return {"message": "Permission added successfully", "id": new_permission.id}
+    async with SessionLocal() as db, db.begin():
+        permission_id = (await db.execute(
+            pg_insert(Permission).values(name=name, description=description, api_endpoint=api_endpoint)
+            .on_conflict_do_nothing().returning(Permission.id)
+        )).scalar_one_or_none()
+        if permission_id is None:
+            raise HTTPException(status_code=400, detail="Permission already exists")
+    return {"message": "Permission added successfully", "id": permission_id}
+
+@app.post("/permissions/bulk")
+async def add_permissions_bulk(permissions: List[PermissionCreate]):
+    if not permissions:
+        return {"message": "No permissions added", "ids": []}
+    async with SessionLocal() as db, db.begin():
+        # Permissions that already exist are skipped
+        ids = (await db.execute(BULK_INSERT_PERMISSIONS, [
+            {"name": p.name, "description": p.description, "api_endpoint": p.api_endpoint}
+            for p in permissions
+        ])).scalars().all()
+    return {"message": f"{len(ids)} permissions added successfully", "ids": ids}
 
 @app.put("/permissions/{permission_id}")
-def modify_permission(
+async def modify_permission(
     permission_id: int, 
     name: Optional[str] = None, 
     api_endpoint: Optional[str] = None, 
-    description: Optional[str] = None, 
-    db: Session = Depends(get_db)
+    description: Optional[str] = None
 ):
-    permission = db.query(Permission).filter(Permission.id == permission_id).first()
-    if not permission:
-        raise HTTPException(status_code=404, detail="Permission not found")
-    if name:
-        permission.name = name
-    if api_endpoint:
-        permission.api_endpoint = api_endpoint
-    if description:
-        permission.description = description
-    db.commit()
+    async with SessionLocal() as db, db.begin():
+        permission = (await db.execute(select(Permission).where(Permission.id == permission_id))).scalar_one_or_none()
+        if not permission:
+            raise HTTPException(status_code=404, detail="Permission not found")
+        if name:
+            permission.name = name
+        if api_endpoint:
+            permission.api_endpoint = api_endpoint
+        if description:
+            permission.description = description
     return {"message": "Permission updated successfully"}
 
 @app.delete("/permissions/{permission_id}")
-def delete_permission(permission_id: int, db: Session = Depends(get_db)):
-    permission = db.query(Permission).filter(Permission.id == permission_id).first()
-    if not permission:
-        raise HTTPException(status_code=404, detail="Permission not found")
-    db.delete(permission)
-    db.commit()
+async def delete_permission(permission_id: int):
+    async with SessionLocal() as db, db.begin():
+        permission = (await db.execute(select(Permission).where(Permission.id == permission_id))).scalar_one_or_none()
+        if not permission:
+            raise HTTPException(status_code=404, detail="Permission not found")
+        await db.delete(permission)
     return {"message": "Permission deleted successfully"}
 
 # Routes for User Subscriptions
 @app.post("/subscriptions")
-def assign_subscription(subscription: SubscriptionAssign, db: Session = Depends(get_db)):
-    user = db.query(User).filter(User.id == subscription.user_id).first()
-    plan = db.query(SubscriptionPlan).filter(SubscriptionPlan.id == subscription.plan_id).first()
-    if not user or not plan:
-        raise HTTPException(status_code=404, detail="User or Plan not found")
-    new_subscription = UserSubscription(user_id=subscription.user_id, plan_id=subscription.plan_id)
-    db.add(new_subscription)
-    db.commit()
+async def assign_subscription(subscription: SubscriptionAssign):
+    async with SessionLocal() as db, db.begin():
+        # Foreign keys reject unknown users/plans and the unique user_id skips a second subscription
+        try:
+            subscription_id = (await db.execute(
+                pg_insert(UserSubscription).values(user_id=subscription.user_id, plan_id=subscription.plan_id)
+                .on_conflict_do_nothing(index_elements=["user_id"]).returning(UserSubscription.id)
+            )).scalar_one_or_none()
+        except IntegrityError:
+            raise HTTPException(status_code=404, detail="User or Plan not found")
+        if subscription_id is None:
+            raise HTTPException(status_code=400, detail="User already has a subscription")
+    await cache_delete(f"sub:{subscription.user_id}")
     return {"message": f"User {subscription.user_id} subscribed to plan {subscription.plan_id}"}
 
+@app.post("/subscriptions/bulk")
+async def assign_subscriptions_bulk(subscriptions: List[SubscriptionAssign]):
+    if not subscriptions:
+        return {"message": "No subscriptions created", "subscription_ids": []}
+    async with SessionLocal() as db, db.begin():
+        # Users that already have a subscription are skipped; an unknown user or plan fails the whole batch
+        try:
+            subscription_ids = (await db.execute(BULK_INSERT_SUBSCRIPTIONS, [
+                {"user_id": s.user_id, "plan_id": s.plan_id} for s in subscriptions
+            ])).scalars().all()
+        except IntegrityError:
+            raise HTTPException(status_code=404, detail="User or Plan not found")
+    await cache_delete(*{f"sub:{s.user_id}" for s in subscriptions})
+    return {"message": f"{len(subscription_ids)} subscriptions created successfully", "subscription_ids": subscription_ids}
+
 @app.get("/subscriptions/{user_id}")
-def get_subscription(user_id: int, db: Session = Depends(get_db)):
-    subscription = db.query(UserSubscription).filter(UserSubscription.user_id == user_id).first()
-    if not subscription:
-        raise HTTPException(status_code=404, detail="Subscription not found")
-    plan = subscription.plan
+async def get_subscription(user_id: int):
+    async with SessionLocal() as db, db.begin():
+        plan_id = await cache_get(f"sub:{user_id}")
+        if plan_id is None:
+            subscription = (await db.execute(GET_SUBSCRIPTION_WITH_PLAN, {"uid": user_id})).scalar_one_or_none()
+            if not subscription:
+                raise HTTPException(status_code=404, detail="Subscription not found")
+            await cache_set(f"sub:{user_id}", subscription.plan_id)
+            plan = await cache_plan(subscription.plan)
+            usage_count = await get_usage_count(user_id)
+            if usage_count is None:
+                usage_count = subscription.usage_count
+        else:
+            # Only the usage counter changes per request, so it is the only thing read from the DB
+            plan = await get_plan(db, int(plan_id))
+            usage_count = await get_usage_count(user_id)
+            if usage_count is None:
+                usage_count = (await db.execute(GET_USAGE_COUNT_BY_USER, {"uid": user_id})).scalar_one_or_none()
+            if plan is None or usage_count is None:
+                raise HTTPException(status_code=404, detail="Subscription not found")
     return {
-        "user_id": subscription.user_id,
-        "plan": {
-            "name": plan.name,
-            "description": plan.description,
-            "api_permissions": plan.api_permissions.split(","),
-            "usage_limit": plan.usage_limit,
-        },
-        "usage_count": subscription.usage_count
+        "user_id": user_id,
+        "plan": plan,
+        "usage_count": usage_count
     }
 
 @app.put("/subscriptions/{user_id}")
-def update_subscription(user_id: int, plan_id: int, db: Session = Depends(get_db)):
-    subscription = db.query(UserSubscription).filter(UserSubscription.user_id == user_id).first()
-    if not subscription:
-        raise HTTPException(status_code=404, detail="Subscription not found")
-    subscription.plan_id = plan_id
-    db.commit()
+async def update_subscription(user_id: int, plan_id: int):
+    async with SessionLocal() as db, db.begin():
+        subscription = (await db.execute(GET_SUBSCRIPTION_BY_USER, {"uid": user_id})).scalar_one_or_none()
+        if not subscription:
+            raise HTTPException(status_code=404, detail="Subscription not found")
+        subscription.plan_id = plan_id
+    await cache_delete(f"sub:{user_id}")
     return {"message": f"Subscription updated to plan {plan_id}"}
 
 # Access Control
 @app.get("/access/{user_id}/{api_request}")
-def check_access(user_id: int, api_request: str, db: Session = Depends(get_db)):
-    subscription = db.query(UserSubscription).filter(UserSubscription.user_id == user_id).first()
-    if not subscription:
+async def check_access(user_id: int, api_request: str):
+    async with UsageSessionLocal() as db, db.begin():
+        # With the cache enabled, reject unknown users and disallowed APIs without touching the DB
+        if redis is not None:
+            plan_id = await get_subscription_plan_id(db, user_id)
+            if plan_id is None:
+                raise HTTPException(status_code=404, detail="Subscription not found")
+            if not await plan_allows(db, plan_id, api_request):
+                raise HTTPException(status_code=403, detail="Access denied")
+            plan = await get_plan(db, plan_id)
+            if plan is None:
+                raise HTTPException(status_code=404, detail="Subscription not found")
+            try:
+                count = await incr_usage(db, user_id, plan["usage_limit"])
+            except RedisError as exc:
+                # Redis owns the live counters, so the limit can't be enforced without it
+                logger.warning("Redis usage increment for user %s failed: %s", user_id, exc)
+                raise HTTPException(status_code=503, detail="Usage tracking unavailable")
+            if count is None:
+                raise HTTPException(status_code=403, detail="Usage limit exceeded")
+            return {"message": "Access granted"}
+        # Check the permission and the limit and bump the counter in one atomic UPDATE ... FROM
+        if USE_PGBOUNCER:
+            await db.execute(ASYNC_COMMIT)
+        granted = (await db.execute(CONSUME_ACCESS, {"uid": user_id, "api": api_request})).first()
+        if granted:
+            return {"message": "Access granted"}
+        # Nothing was updated: work out why with a single read
+        reason = (await db.execute(GET_ACCESS_DENIAL, {"uid": user_id, "api": api_request})).first()
+    if reason is None:
         raise HTTPException(status_code=404, detail="Subscription not found")
-    plan = subscription.plan
-    if api_request not in plan.api_permissions.split(","):
+    if not reason[0]:
         raise HTTPException(status_code=403, detail="Access denied")
-    if subscription.usage_count >= plan.usage_limit:
-        raise HTTPException(status_code=403, detail="Usage limit exceeded")
-    subscription.usage_count += 1
-    db.commit()
-    return {"message": "Access granted"}
+    raise HTTPException(status_code=403, detail="Usage limit exceeded")
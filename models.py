@@ -0,0 +1,112 @@
+from sqlalchemy import Column, Integer, String, ForeignKey, Index
+from sqlalchemy.dialects.postgresql import ARRAY
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncSession
+from sqlalchemy.orm import declarative_base, relationship
+from sqlalchemy.pool import NullPool
+from dotenv import load_dotenv
+import asyncio
+import os
+from typing import Optional
+from uuid import uuid4
+
+# Load environment variables
+load_dotenv()
+
+# Get the DATABASE_URL
+DATABASE_URL = os.getenv("DATABASE_URL")
+if not DATABASE_URL:
+    raise ValueError("DATABASE_URL is not set. Please check your environment variables.")
+
+# Database setup (expects a postgresql+asyncpg:// URL)
+# Keep a pool of persistent connections so requests don't pay a TCP/TLS handshake.
+# Set USE_PGBOUNCER=true when DATABASE_URL points at PgBouncer to let it do the pooling.
+USE_PGBOUNCER = os.getenv("USE_PGBOUNCER", "false").lower() == "true"
+
+def make_engine(pool_size: int, max_overflow: int, server_settings: Optional[dict] = None):
+    if USE_PGBOUNCER:
+        # PgBouncer in transaction mode can hand each transaction a different server backend:
+        # disable the statement caches and give every prepared statement a unique name so
+        # asyncpg's sequential __asyncpg_stmt_N__ names can't collide across backends
+        return create_async_engine(
+            DATABASE_URL,
+            poolclass=NullPool,
+            connect_args={
+                "statement_cache_size": 0,
+                "prepared_statement_cache_size": 0,
+                "prepared_statement_name_func": lambda: f"__asyncpg_{uuid4()}__",
+            },
+        )
+    connect_args = {"statement_cache_size": 1024, "prepared_statement_cache_size": 1024}
+    if server_settings:
+        connect_args["server_settings"] = server_settings
+    return create_async_engine(
+        DATABASE_URL,
+        pool_size=pool_size,
+        max_overflow=max_overflow,
+        pool_timeout=30,
+        pool_pre_ping=True,
+        pool_recycle=3600,
+        query_cache_size=1200,
+        connect_args=connect_args,
+    )
+
+engine = make_engine(int(os.getenv("DB_POOL_SIZE", "10")), int(os.getenv("DB_MAX_OVERFLOW", "5")))
+SessionLocal = async_sessionmaker(engine, class_=AsyncSession, autoflush=False, expire_on_commit=False)
+
+# Usage counters can lose the last few increments on a crash, so /access and the usage
+# flush run on connections with synchronous_commit off; everything else stays synchronous.
+# PgBouncer shares server connections between clients, so there they use the main engine
+# and each usage transaction runs SET LOCAL synchronous_commit = off instead (see main.py).
+# Its pool is small because each usage transaction is a single short statement.
+usage_engine = engine if USE_PGBOUNCER else make_engine(
+    int(os.getenv("DB_USAGE_POOL_SIZE", "4")),
+    int(os.getenv("DB_USAGE_MAX_OVERFLOW", "2")),
+    {"synchronous_commit": "off"},
+)
+UsageSessionLocal = async_sessionmaker(usage_engine, class_=AsyncSession, autoflush=False, expire_on_commit=False)
+Base = declarative_base()
+
+# Schema setup is a one-off step (python models.py), not part of worker startup
+async def init_db():
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+    await engine.dispose()
+
+# Database Models
+class User(Base):
+    __tablename__ = "users"
+    id = Column(Integer, primary_key=True, index=True)
+    name = Column(String(255), nullable=False)
+    email = Column(String(255), unique=True, nullable=False)
+    subscriptions = relationship("UserSubscription", back_populates="user")
+
+class SubscriptionPlan(Base):
+    __tablename__ = "subscription_plans"
+    id = Column(Integer, primary_key=True, index=True)
+    name = Column(String(255), unique=True, nullable=False)
+    description = Column(String(255), nullable=True)
+    api_permissions = Column(ARRAY(String(255)), nullable=False)
+    usage_limit = Column(Integer, nullable=False)
+    subscriptions = relationship("UserSubscription", back_populates="plan", passive_deletes=True)
+    __table_args__ = (Index("ix_plan_perms", "api_permissions", postgresql_using="gin"),)
+
+class UserSubscription(Base):
+    __tablename__ = "user_subscriptions"
+    id = Column(Integer, primary_key=True, index=True)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False, unique=True, index=True)
+    plan_id = Column(Integer, ForeignKey("subscription_plans.id"), nullable=False, index=True)
+    usage_count = Column(Integer, default=0, nullable=False)
+    # Must be loaded eagerly; a lazy load here would be an extra round-trip per request
+    plan = relationship("SubscriptionPlan", back_populates="subscriptions", lazy="raise")
+    user = relationship("User", back_populates="subscriptions")
+    __table_args__ = (Index("ix_us_user_plan", "user_id", "plan_id"),)
+
+class Permission(Base):
+    __tablename__ = "permissions"
+    id = Column(Integer, primary_key=True, index=True)
+    name = Column(String(255), unique=True, nullable=False)
+    description = Column(String(255), nullable=True)
+    api_endpoint = Column(String(255), unique=True, nullable=False)
+
+if __name__ == "__main__":
+    asyncio.run(init_db())
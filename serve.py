@@ -0,0 +1,80 @@
+import multiprocessing
+import os
+import signal
+import socket
+import sys
+import time
+import uvicorn
+
+# Production launcher: one uvicorn server per worker process, each with its own
+# SO_REUSEPORT listening socket so the kernel spreads connections across workers
+HOST = os.getenv("HOST", "0.0.0.0")
+PORT = int(os.getenv("PORT", "8000"))
+WORKERS = int(os.getenv("WEB_CONCURRENCY", str(os.cpu_count() or 1)))
+
+# Give up (and exit non-zero) if workers keep dying, e.g. because bind() fails
+MAX_RESTARTS = WORKERS * 3
+RESTART_WINDOW = 60
+
+stopping = False
+
+def bind_socket() -> socket.socket:
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+    sock.bind((HOST, PORT))
+    return sock
+
+def run_worker():
+    # Drop the supervisor's handlers; uvicorn installs its own for graceful shutdown
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    signal.signal(signal.SIGINT, signal.SIG_DFL)
+    config = uvicorn.Config("main:app", loop="uvloop", http="httptools", access_log=False, log_level="warning")
+    uvicorn.Server(config).run(sockets=[bind_socket()])
+
+def spawn() -> multiprocessing.Process:
+    worker = multiprocessing.Process(target=run_worker)
+    worker.start()
+    return worker
+
+def stop(signum, frame):
+    global stopping
+    stopping = True
+
+def main() -> int:
+    # Handlers go in before any worker starts so a signal can never orphan them
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+
+    workers = [spawn() for _ in range(WORKERS)]
+    restarts = []
+    failed = False
+
+    # Supervise: replace workers that exit on their own until shutdown is requested
+    while not stopping:
+        time.sleep(0.5)
+        for i, worker in enumerate(workers):
+            if worker.is_alive() or stopping:
+                continue
+            print(f"Worker {worker.pid} exited with code {worker.exitcode}", file=sys.stderr)
+            now = time.monotonic()
+            restarts = [t for t in restarts if now - t < RESTART_WINDOW] + [now]
+            if len(restarts) > MAX_RESTARTS:
+                print("Workers keep exiting; shutting down", file=sys.stderr)
+                failed = True
+                stop(None, None)
+                break
+            workers[i] = spawn()
+
+    # Pass the shutdown on to the workers so they drain and exit cleanly
+    for worker in workers:
+        if worker.is_alive():
+            os.kill(worker.pid, signal.SIGTERM)
+    for worker in workers:
+        worker.join()
+        if worker.exitcode not in (0, -signal.SIGTERM, -signal.SIGINT):
+            failed = True
+    return 1 if failed else 0
+
+if __name__ == "__main__":
+    sys.exit(main())